@@ -42,24 +42,31 @@ Importing all necessary modules for simulation, analysis and plotting.
 '''
 
 from scipy.optimize import fsolve
+from scipy.special import lambertw
+
+import time
+import os
+import sys
+
+# render off-screen if no display is available, has to be set before
+# nest.raster_plot imports pylab
+import matplotlib
+if not os.environ.get('DISPLAY'):
+    matplotlib.use('Agg')
 
 import nest
 import nest.raster_plot
 import nest.topology as tp
 
-import time
-import os
-import sys
-import glob
 import numpy as np
-from numpy import exp, random, zeros_like, r_
+from numpy import exp, random
 
 random.seed(123456)
 
 
 '''
 Definition of functions used in this example. First, define the
-Lambert W function implemented in SLI. The second function
+Lambert W function on its lower branch (k=-1). The second function
 computes the maximum of the postsynaptic potential for a synaptic
 input current of unit amplitude (1 pA) using the Lambert W
 function. Thus function will later be used to calibrate the synaptic
@@ -67,8 +74,7 @@ weights.
 '''
 
 def LambertWm1(x):
-    nest.sli_push(x); nest.sli_run('LambertWm1'); y=nest.sli_pop()
-    return y
+    return float(lambertw(x, k=-1).real)
 
 def ComputePSPnorm(tauMem, CMem, tauSyn):
   a = (tauMem / tauSyn)
@@ -180,16 +186,14 @@ sigma = 0.3          # Gaussian profile, sigma in mm
 
 layerdict_EX = {
     'extent' : [extent_length, extent_length],
-    'positions' : [[(random.rand()-0.5)*extent_length,
-                    (random.rand()-0.5)*extent_length] for n in xrange(NE)],
+    'positions' : ((random.rand(NE, 2) - 0.5) * extent_length).tolist(),
     'elements' : 'iaf_psc_alpha',
     'edge_wrap' : True, # PBC
 }
 
 layerdict_IN = {
     'extent' : [extent_length, extent_length],
-    'positions' : [[(random.rand()-0.5)*extent_length,
-                    (random.rand()-0.5)*extent_length] for n in xrange(NI)],
+    'positions' : ((random.rand(NI, 2) - 0.5) * extent_length).tolist(),
     'elements' : 'iaf_psc_alpha',
     'edge_wrap' : True,
 }
@@ -202,10 +206,11 @@ around the center of the sheet.
 
 N_stim = int(NE * np.pi * stim_radius**2 / extent_length**2)
 
-rnds_angle = [2.*np.pi * random.rand() for n in xrange(N_stim)]
-rnds_radius = [stim_radius * random.rand() for n in xrange(N_stim)]
-stim_positions = [[rr * np.cos(ra),
-                   rr * np.sin(ra)] for ra,rr in zip(rnds_angle, rnds_radius)]
+rnds_angle = 2.*np.pi * random.rand(N_stim)
+rnds_radius = stim_radius * random.rand(N_stim)
+# NEST topology expects the positions as nested Python lists
+stim_positions = np.column_stack([rnds_radius * np.cos(rnds_angle),
+                                  rnds_radius * np.sin(rnds_angle)]).tolist()
 
 layerdict_stim = {
     'extent' : [extent_length, extent_length],
@@ -214,6 +219,19 @@ layerdict_stim = {
     'edge_wrap' : True,
 }
 
+'''
+Neuron positions as arrays for the analysis and the plotting.
+'''
+
+positions_ex = np.asarray(layerdict_EX['positions'])
+positions_in = np.asarray(layerdict_IN['positions'])
+positions_stim = np.asarray(layerdict_stim['positions'])
+
+# x positions (views) for the sorted raster and the spatial histogram
+pos_x_ex = positions_ex[:, 0]
+pos_x_in = positions_in[:, 0]
+pos_x_stim = positions_stim[:, 0]
+
 '''
 Connection dictionaries are defined.
 '''
@@ -345,13 +363,14 @@ Distribute initial membrane voltages.
 '''
 
 for neurons in [nodes_ex, nodes_in]:
-    for neuron in neurons:
-        nest.SetStatus([neuron], {'V_m': theta * np.random.rand()})
+    vms = (theta * np.random.rand(len(neurons))).tolist()
+    nest.SetStatus(list(neurons), [{'V_m': vm} for vm in vms])
 
 '''
 Create spike detectors for recording from the excitatory and the
 inhibitory populations and a poisson generator as noise source.
-The spike detectors are configured for writing to file.
+The spike detectors record to memory, the spikes of all threads are
+written to a single file per population after the simulation.
 '''
 
 espikes = nest.Create("spike_detector")
@@ -359,26 +378,26 @@ ispikes = nest.Create("spike_detector")
 stim_spikes = nest.Create("spike_detector")
 
 nest.SetStatus(espikes,[{
-                   "label": os.path.join(spike_output_path, label + "-0"),
                    "withtime": True,
                    "withgid": True,
-                   "to_file": True,
-                   "start" : transient, 
+                   "to_file": False,
+                   "to_memory": True,
+                   "start" : transient,
                    }])
 
 nest.SetStatus(ispikes,[{
-                   "label": os.path.join(spike_output_path, label + "-1"),
                    "withtime": True,
                    "withgid": True,
-                   "to_file": True,
+                   "to_file": False,
+                   "to_memory": True,
                    "start" : transient,
                    }])
 
 nest.SetStatus(stim_spikes,[{
-                   "label": os.path.join(spike_output_path, label + "-2"),
                    "withtime": True,
                    "withgid": True,
-                   "to_file": True,
+                   "to_file": False,
+                   "to_memory": True,
                    "start" : transient,
                    }])
 
@@ -533,28 +552,21 @@ print("Simulation time   : %.2f s" % sim_time)
 
 
 '''
-Merging spike files, Writing population GIDs and a configuration
+Writing spikes, population GIDs and a configuration
 file for viola to file and plotting a spike raster.
 '''
 
-def merge_spike_files():
+def write_spike_files():
     '''
-    merge spike files from different threads
+    write recorded spikes of all threads to one file per population
     '''
-    for i, pop in enumerate(['EX', 'IN', 'STIM']):
-        old_filenames = glob.glob(os.path.join(spike_output_path, label + '-' + str(i) + '*.gdf'))
-        data = np.empty((0, 2))
-        for t in range(len(old_filenames)):
-            data = np.vstack([data, np.loadtxt(old_filenames[t])])
-            os.remove(old_filenames[t])
-        order = np.argsort(data[:, 1]) # sort spike times
+    for i, spikes in enumerate([espikes, ispikes, stim_spikes]):
+        events = nest.GetStatus(spikes, 'events')[0]
+        data = np.column_stack([events['senders'], events['times']])
+        order = np.argsort(data[:, 1], kind='mergesort') # sort spike times
         data = data[order]
-        # write to new file having the same filename as for thread 0
-        new_filename = os.path.join(spike_output_path, label+'-'+ str(i) + '.gdf')
-        with open(new_filename, 'w') as f:
-            for line in data:
-                f.write('%d\t%.3f\n' % (line[0], line[1]))
-        f.close()
+        fname = os.path.join(spike_output_path, label+'-'+ str(i) + '.gdf')
+        np.savetxt(fname, data, fmt=['%d', '%.3f'], delimiter='\t')
     return
 
 def write_population_GIDs():
@@ -568,7 +580,7 @@ def write_population_GIDs():
         f.write('%d\t%d\n' % (nodes_stim[0], nodes_stim[-1]))
     f.close()
 
-merge_spike_files()
+write_spike_files()
 write_population_GIDs()
 
 import matplotlib.pyplot as plt
@@ -576,13 +588,9 @@ import matplotlib.colors as mpc
 import json
 
 #population colors
-popColors = []
 # EX and IN from colormap, STIM in dark
 cmap = plt.get_cmap('rainbow_r', 2)
-for i in range(cmap.N):
-    rgb = cmap(i)[:3]
-    col_hex = mpc.rgb2hex(rgb)
-    popColors.append(col_hex)
+popColors = [mpc.to_hex(rgba) for rgba in cmap(np.arange(cmap.N))]
 popColors.append('#2E2E2E')
 popColors = ','.join(popColors)
 
@@ -602,7 +610,7 @@ config_dict.update({
 })
 
 with open(os.path.join(spike_output_path, 'config_raw.json'), 'w') as f:
-    json.dump(config_dict, f)
+    json.dump(config_dict, f, separators=(',', ':'))
 
 
 '''
@@ -620,6 +628,10 @@ if True:
     import matplotlib.gridspec as gridspec
 
     plt.rcParams['figure.dpi'] = 160.
+    # faster Agg rendering of the large point clouds
+    plt.rcParams['path.simplify'] = True
+    plt.rcParams['path.simplify_threshold'] = 1.0
+    plt.rcParams['agg.path.chunksize'] = 10000
 
     # stepsize for diluting (1 = all)
     dilute = int(10) # int
@@ -629,56 +641,58 @@ if True:
 
     stim_events = nest.GetStatus(stim_spikes, 'events')[0]
 
-    def plot_spikes(ax, nodes=nodes_ex, events=eevents,
-                    layerdict=layerdict_EX,
-                    color='r',
-                    marker='.', poplabel='EX',
-                    position_sorted=True):
+    def get_spikes(nodes=nodes_ex, events=eevents,
+                   pos_x=pos_x_ex,
+                   position_sorted=True):
         '''
-        plot unsorted or sorted spike raster, flexible for both populations
+        get spike times and unsorted or sorted spike raster positions,
+        flexible for all populations
         '''
-        X = []
-        T = []
-        for i, j in enumerate(nodes):
-            #extract spikes
-            t = events['times'][events['senders'] == j]
-            x, y = layerdict['positions'][i]
-            if t.size > 0:
-                T = r_[T, t] # concatenate spike times
-
-                if position_sorted:
-                    pos = x # sorted by x positions
-                else:
-                    pos = j
-
-                X = r_[X, zeros_like(t) + pos]
+        # group spike times by sender (nodes have consecutive GIDs), the
+        # number of spikes per node is counted in a single pass
+        order = np.argsort(events['senders'], kind='mergesort')
+        T = events['times'][order]
+        counts = np.bincount(np.asarray(events['senders']) - nodes[0],
+                             minlength=len(nodes))
+
+        if position_sorted:
+            pos = pos_x # sorted by x positions
+        else:
+            pos = np.array(nodes)
+        X = np.repeat(pos, counts)
 
         # dilute
-        X = X[np.arange(0, len(X), dilute)]
-        T = T[np.arange(0, len(T), dilute)]
+        X = X[::dilute]
+        T = T[::dilute]
 
-        ax.plot(T, X, marker, markersize=1., color=color, label=poplabel,
-                rasterized=True)
-        return
+        return T, X
 
 
     def plot_spikes_all_pop(ax, position_sorted=True):
-
-        plot_spikes(ax, nodes=nodes_ex, events=eevents,
-                    layerdict=layerdict_EX,
-                    color=cmap(0),
-                    marker='.', poplabel='EX',
-                    position_sorted=position_sorted)
-        plot_spikes(ax, nodes=nodes_in, events=ievents,
-                    layerdict=layerdict_IN,
-                    color=cmap(1),
-                    marker='.', poplabel='IN',
-                    position_sorted=position_sorted)
-        plot_spikes(ax, nodes=nodes_stim, events=stim_events,
-                    layerdict=layerdict_stim,
-                    color='k',
-                    marker='.', poplabel='STIM',
-                    position_sorted=position_sorted)
+        '''
+        plot the spike rasters of all populations with a single scatter call
+        '''
+        T_all = []
+        X_all = []
+        colors_all = []
+        for nodes, events, pos_x, color, poplabel in zip(
+                [nodes_ex, nodes_in, nodes_stim],
+                [eevents, ievents, stim_events],
+                [pos_x_ex, pos_x_in, pos_x_stim],
+                [cmap(0), cmap(1), 'k'],
+                ['EX', 'IN', 'STIM']):
+            T, X = get_spikes(nodes=nodes, events=events,
+                              pos_x=pos_x,
+                              position_sorted=position_sorted)
+            T_all.append(T)
+            X_all.append(X)
+            colors_all.append(np.tile(mpc.to_rgba(color), (T.size, 1)))
+            # empty line as legend entry of the population
+            ax.plot([], [], '.', markersize=1., color=color, label=poplabel)
+
+        ax.scatter(np.concatenate(T_all), np.concatenate(X_all), s=1,
+                   c=np.concatenate(colors_all), marker=',', linewidths=0,
+                   rasterized=True)
 
         if position_sorted:
             ax.set_title('sorted spike raster')
@@ -688,16 +702,55 @@ if True:
         return
 
 
+    def plot_step_hist(ax, counts, bins, colors, orientation='vertical'):
+        '''
+        draw histogram counts precomputed with np.histogram as step lines,
+        looks like ax.hist(..., histtype='step')
+        '''
+        edges = np.repeat(bins, 2)
+        for c, color in zip(counts, colors):
+            steps = np.r_[0, np.repeat(c, 2), 0]
+            if orientation == 'horizontal':
+                ax.plot(steps, edges, color=color)
+            else:
+                ax.plot(edges, steps, color=color)
+        if orientation == 'horizontal':
+            ax.set_xlim(left=0)
+        else:
+            ax.set_ylim(bottom=0)
+        return
+
+
+    spikes_figure = {}
+
+    def get_spikes_figure():
+        '''
+        create figure and axes of all panels only once and clear the axes
+        for reuse, e.g., in parameter sweeps
+        '''
+        if not spikes_figure:
+            fig = plt.figure(figsize=(8., 8.))
+            gs = gridspec.GridSpec(6,5)
+            #fig.subplots_adjust(top=0.9, bottom=0.07, left=0.1, right=0.95,
+            #                    hspace=0.05, wspace=0.1)
+            axes = [fig.add_subplot(gs[:2,:4]), # unsorted
+                    fig.add_subplot(gs[:2, 4]),
+                    fig.add_subplot(gs[2:4,:4]), # sorted
+                    fig.add_subplot(gs[2:4, 4]),
+                    fig.add_subplot(gs[4:6, :4])]
+            spikes_figure.update({'fig': fig, 'axes': axes})
+        for ax in spikes_figure['axes']:
+            ax.cla()
+        return spikes_figure['fig'], spikes_figure['axes']
+
+
     def plot_spikes_figure():
-        fig = plt.figure(figsize=(8., 8.))
-        gs = gridspec.GridSpec(6,5)
-        #fig.subplots_adjust(top=0.9, bottom=0.07, left=0.1, right=0.95,
-        #                    hspace=0.05, wspace=0.1)
+        fig, axes = get_spikes_figure()
 
         colors = [cmap(0), cmap(1), (0., 0., 0., 1.)]
         
         # unsorted raster
-        ax = plt.subplot(gs[:2,:4]) # unsorted
+        ax = axes[0] # unsorted
         plot_spikes_all_pop(ax, position_sorted=False)
         ax.axis(ax.axis('tight'))
         #ax.legend(loc=1, numpoints=1, markerscale=10)
@@ -710,11 +763,14 @@ if True:
        
         
         # spike count histogram over unit
-        ax = plt.subplot(gs[:2, 4])
-        allnodes = np.array(nodes_ex + nodes_in + nodes_stim)
+        ax = axes[1]
+        allnodes = np.concatenate([np.fromiter(nodes, dtype=np.int64)
+                                   for nodes in [nodes_ex, nodes_in, nodes_stim]])
         binsize = 20.
         bins = np.arange(allnodes.min(), allnodes.max()+binsize, binsize)
-        ax.hist([eevents['senders'], ievents['senders'], stim_events['senders']], bins=bins, histtype='step', color=colors, orientation='horizontal', stacked=False, alpha=1)
+        counts = [np.histogram(senders, bins=bins)[0] for senders in
+                  [eevents['senders'], ievents['senders'], stim_events['senders']]]
+        plot_step_hist(ax, counts, bins, colors, orientation='horizontal')
         ax.set_yticklabels([])
         # ax.axis(ax.axis('tight'))
         ax.set_ylim(bins[0], bins[-1])
@@ -723,7 +779,7 @@ if True:
         ax.set_title('spike\ncount')
         
         # sorted raster
-        ax = plt.subplot(gs[2:4,:4]) # sorted
+        ax = axes[2] # sorted
         plot_spikes_all_pop(ax, position_sorted=True)
         ax.set_ylabel('x position (mm)')
         ax.set_xticklabels([])
@@ -731,15 +787,16 @@ if True:
 
 
         # spike count histogram over space
-        ax = plt.subplot(gs[2:4, 4])
+        ax = axes[3]
         binsize=0.05
         bins = np.arange(-2, 2+binsize, binsize)
         xlists = []
-        for x, gid0, senders in zip([np.array(layerdict_EX['positions'])[:, 0], np.array(layerdict_IN['positions'])[:, 0], np.array(layerdict_stim['positions'])[:, 0]],
+        for x, gid0, senders in zip([pos_x_ex, pos_x_in, pos_x_stim],
                                         [nodes_ex[0], nodes_in[0], nodes_stim[0]],
                                         [eevents['senders'], ievents['senders'], stim_events['senders']]):
-            xlists += [[x[n-gid0] for n in senders]]
-        ax.hist(xlists, bins=bins, histtype='step', color=colors, orientation='horizontal', stacked=False, alpha=1)
+            xlists += [x[np.asarray(senders) - gid0]]
+        counts = [np.histogram(xlist, bins=bins)[0] for xlist in xlists]
+        plot_step_hist(ax, counts, bins, colors, orientation='horizontal')
         # ax.axis(ax.axis('tight'))
         ax.set_ylim(bins[0], bins[-1])
         ax.set_xlabel('count')
@@ -749,17 +806,20 @@ if True:
 
 
         # spike count histogram over time
-        ax = plt.subplot(gs[4:6, :4])
+        ax = axes[4]
         bins = np.arange(transient, simtime+1, 1)
-        ax.hist([eevents['times'], ievents['times'], stim_events['times']], bins=bins, histtype='step', color=colors, stacked=False, alpha=1)
+        counts = [np.histogram(times, bins=bins)[0] for times in
+                  [eevents['times'], ievents['times'], stim_events['times']]]
+        plot_step_hist(ax, counts, bins, colors)
         ax.set_xlabel('time (ms)')
         ax.set_ylabel('count')
         ax.set_title('spike count')
         ax.text(-0.05, 1.05, 'E', ha='left', va='bottom', fontsize=16, transform=ax.transAxes)
         
-        plt.tight_layout()
+        fig.tight_layout()
 
         fig.savefig(os.path.join(spike_output_path, 'raster.pdf'), dpi=300)
-        plt.show()
+        if os.environ.get('DISPLAY'):
+            plt.show()
 
     plot_spikes_figure()